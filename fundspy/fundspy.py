@@ -7,16 +7,18 @@ This python based project helps you to extract and analyze data related to brazi
 """
 
 #modules from the python standard library
-import os
-import os.path
+import io
 import zipfile
 import datetime
 import calendar
 import sqlite3
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 #packages used to download data
 import requests
-from urllib.request import HTTPError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from yahoofinancials import YahooFinancials
 
 #packages used to manipulate data
@@ -29,65 +31,309 @@ from tqdm import tqdm
 from workalendar.america import Brazil
 from dateutil.relativedelta import relativedelta
 
-def cvm_informes (year: int, mth: int) -> pd.DataFrame:
+#number of reports downloaded in parallel when building the database
+_DOWNLOAD_WORKERS = 16
+
+#maximum number of reports downloaded or waiting to be inserted at the same time. Bounds the memory used by the
+#parsed reports when the inserts fall behind the downloads
+_MAX_PENDING_REPORTS = _DOWNLOAD_WORKERS * 2
+
+#http session shared by all the downloads, so the connections to the CVM website are reused (keep-alive)
+#and the files are transferred compressed. Throttling and server errors are retried with backoff, as connection errors
+_SESSION = requests.Session()
+_SESSION.headers['Accept-Encoding'] = 'gzip, deflate'
+_RETRY = Retry(total = 3, backoff_factor = 1, status_forcelist = (429, 500, 502, 503, 504), raise_on_status = False)
+_SESSION.mount('http://', HTTPAdapter(pool_connections = _DOWNLOAD_WORKERS, pool_maxsize = _DOWNLOAD_WORKERS, max_retries = _RETRY))
+_SESSION.mount('https://', HTTPAdapter(pool_connections = _DOWNLOAD_WORKERS, pool_maxsize = _DOWNLOAD_WORKERS, max_retries = _RETRY))
+
+#numeric columns of the daily reports that can be read as float32
+_FLOAT32_COLUMNS = ['VL_TOTAL', 'VL_QUOTA', 'VL_PATRIM_LIQ', 'CAPTC_DIA', 'RESG_DIA']
+
+#columns of the daily_quotas table. The reports are aligned to them, so columns added to or missing from
+#some of the CVM files don't break the union of the reports
+_DAILY_QUOTAS_COLUMNS = ['CNPJ_FUNDO', 'DT_COMPTC', 'VL_TOTAL', 'VL_QUOTA', 'VL_PATRIM_LIQ', 'CAPTC_DIA', 'RESG_DIA', 'NR_COTST']
+
+#index of the daily_quotas table, used by the queries of each fund history
+_CNPJ_DATE_INDEX = '''
+    CREATE INDEX IF NOT EXISTS "cnpj_date" ON "daily_quotas" (
+        "CNPJ_FUNDO" ASC,
+        "DT_COMPTC" ASC
+    )'''
+
+#number of months to be reloaded by update_db above which the index is dropped and rebuilt after the inserts,
+#instead of being updated row by row. Small updates are cheaper to insert with the index in place
+_INDEX_REBUILD_MONTHS = 12
+
+#columns renamed in the CVM files over time, mapped to their names in the daily_quotas table
+_RENAMED_COLUMNS = {'CNPJ_FUNDO_CLASSE': 'CNPJ_FUNDO'}
+
+def cvm_informes (year: int, mth: int, downcast: bool = False, target_funds: list = []) -> pd.DataFrame:
     """Downloads the daily report (informe diario) from CVM for a given month and year\n
 
     <b>Parameters:</b>\n
     year (int): The year of the report the function should download\n
     mth (int): The month of the report the function should download\n
+    downcast (bool): Opitional (Defaults to False). If True, reads the quota, net worth and cash flow columns as float32 instead of float64, halving the memory used by the report (with ~7 significant digits of precision).\n
+    target_funds (list): Opitional (Defaults to []). List of target funds CNPJs. If not empty, only these funds are kept, filtering the csv files while they are read.\n
 
     <b>Returns:</b>\n
-    pd.DataFrame: Pandas dataframe with the report for the given month and year. If the year is previous to 2017, will contain data regarding the whole year
+    pd.DataFrame: Pandas dataframe with the report for the given month and year. If the year is previous to 2017, will contain data regarding the whole year. If theres no report for the given date, returns None.
 
    """
+    informes = _informe_parts(year, mth, downcast, target_funds)
+    if informes is None: #theres no report for this date
+        return None
+    return informes[0] if len(informes) == 1 else pd.concat(informes, ignore_index=True)
+
+
+def _informe_parts(year: int, mth: int, downcast: bool = False, target_funds: list = []) -> list:
+    """Downloads the daily report (informe diario) from CVM for a given month and year, as the list of csv files it is made of.\n
+    Used by the database functions to insert the yearly reports prior to 2017 file by file, without concatenating them first.\n
+
+    <b>Parameters:</b>\n
+    year (int): The year of the report the function should download\n
+    mth (int): The month of the report the function should download\n
+    downcast (bool): Opitional (Defaults to False). If True, reads the quota, net worth and cash flow columns as float32 instead of float64.\n
+    target_funds (list): Opitional (Defaults to []). List of target funds CNPJs. If not empty, only these funds are kept.\n
+
+    <b>Returns:</b>\n
+    list: List of pandas dataframes with the parts of the report, aligned to the columns of the daily_quotas table. If theres no report for the given date (404), returns None.
+    Any other download or parsing error is raised.
+
+   """
+
+    #declares the types of the columns, so pandas doesn't have to infer them, and parses only the columns stored in the database
+    dtype = {'CNPJ_FUNDO': str, 'CNPJ_FUNDO_CLASSE': str, 'DT_COMPTC': str}
+    dtype.update({col: (np.float32 if downcast else np.float64) for col in _FLOAT32_COLUMNS})
+    usecols = lambda col: col in _DAILY_QUOTAS_COLUMNS or col in _RENAMED_COLUMNS
+    targets = frozenset(target_funds) #the set is built once for all the files of the report
 
     if int(year) >= 2017: #uses download process from reports after the year of 2017
-        try:
-            mth = f"{mth:02d}"
-            year = str(year)
-            #creates url using the parameters provided to the function
-            url = 'http://dados.cvm.gov.br/dados/FI/DOC/INF_DIARIO/DADOS/inf_diario_fi_'+year+mth+'.csv'
-            
-            #reads the csv returned by the link
-            cotas = pd.read_csv(url, sep =';')
-            cotas['DT_COMPTC'] = pd.to_datetime(cotas['DT_COMPTC']) #casts date column to datetime
-            
-            try:
-                #removes column present in only a few reports to avoid inconsistency when making the union of reports
-                cotas.drop(columns = ['TP_FUNDO'], inplace = True)
-            except KeyError:
-                pass
-            
-            return cotas
-        except HTTPError:
-            print('theres no report for this date yet!.\n')
+        mth = f"{mth:02d}"
+        year = str(year)
+        #creates url using the parameters provided to the function
+        url = 'http://dados.cvm.gov.br/dados/FI/DOC/INF_DIARIO/DADOS/inf_diario_fi_'+year+mth+'.csv'
+        
+        #downloads the csv through the shared session and reads it from memory
+        r = _SESSION.get(url, timeout = 30)
+        if r.status_code == 404: #theres no report for this date yet
+            return None
+        r.raise_for_status()
+        return [_read_informe(io.BytesIO(r.content), dtype, usecols, targets)]
     
     if int(year) < 2017:
-        try:
-            year = str(year)
-
-            url = 'http://dados.cvm.gov.br/dados/FI/DOC/INF_DIARIO/DADOS/HIST/inf_diario_fi_' + year + '.zip'
-            #sends request to the url
-            r = requests.get(url, stream=True, allow_redirects=True)
-            
-            with open('informe' + year + '.zip', 'wb') as fd: #writes the .zip file downloaded
-                fd.write(r.content)
-
-            zip_inf = zipfile.ZipFile('informe' + year + '.zip') #opens the .zip file
-            
+        year = str(year)
+
+        url = 'http://dados.cvm.gov.br/dados/FI/DOC/INF_DIARIO/DADOS/HIST/inf_diario_fi_' + year + '.zip'
+        #streams the .zip file into memory in chunks, without writing it to the disk
+        #and without keeping a second copy of the whole body in the response
+        buffer = io.BytesIO()
+        with _SESSION.get(url, stream=True, allow_redirects=True, timeout = 30) as r:
+            if r.status_code == 404:
+                return None
+            r.raise_for_status()
+            for chunk in r.iter_content(chunk_size = 1024 * 1024):
+                buffer.write(chunk)
+
+        with zipfile.ZipFile(buffer) as zip_inf:
             #le os arquivos csv dentro do arquivo zip
-            informes = [pd.read_csv(zip_inf.open(f), sep=";") for f in zip_inf.namelist()] 
-            cotas = pd.concat(informes,ignore_index=True)
-            
-            cotas['DT_COMPTC'] = pd.to_datetime(cotas['DT_COMPTC']) #casts date column to datetime
-
-            zip_inf.close() #fecha o arquivo zip
-            os.remove('informe' + year + '.zip') #deletes .zip file
-            
-            return cotas
-        
-        except Exception as E:
-            print(E)           
+            return [_read_informe(zip_inf.open(f), dtype, usecols, targets) for f in zip_inf.namelist()]
+
+
+def _read_informe(file, dtype: dict, usecols, targets: frozenset) -> pd.DataFrame:
+    """Reads a csv file of the daily report, casting the date column to datetime and aligning it to the columns of the daily_quotas table.\n
+
+    <b>Parameters:</b>\n
+    file: path or file-like object with the csv file, as downloaded from the CVM website.\n
+    dtype (dict): types of the columns of the file.\n
+    usecols: function that selects the columns of the file to be parsed.\n
+    targets (frozenset): CNPJs of the target funds. If not empty, the file is parsed in chunks and only these funds are kept,
+    so only the rows of the target funds are held as a dataframe (the raw file itself is still fully in memory).\n
+
+    <b>Returns:</b>\n
+    pd.DataFrame: Pandas dataframe with the columns of the daily_quotas table, in the same order.
+
+   """
+    if not targets:
+        cotas = pd.read_csv(file, sep = ';', dtype = dtype, usecols = usecols).rename(columns = _RENAMED_COLUMNS)
+    else:
+        chunks = (chunk.rename(columns = _RENAMED_COLUMNS)
+                  for chunk in pd.read_csv(file, sep = ';', dtype = dtype, usecols = usecols, chunksize = 200000))
+        cotas = pd.concat([chunk[chunk['CNPJ_FUNDO'].isin(targets)] for chunk in chunks], ignore_index = True)
+
+    cotas['DT_COMPTC'] = pd.to_datetime(cotas['DT_COMPTC'], format = '%Y-%m-%d', cache = True) #casts date column to datetime
+
+    #removes the columns present in only a few reports (like TP_FUNDO) to avoid inconsistency when making the union of reports
+    return cotas.reindex(columns = _DAILY_QUOTAS_COLUMNS)
+
+
+def _insert_daily_quotas(con: sqlite3.Connection, informes: list, chunksize: int = 10000):
+    """Appends a daily report to the daily_quotas table using batched executemany calls on the given connection.\n
+    Unlike DataFrame.to_sql, it does not commit after the insert, so many reports can be pushed inside a single transaction.
+    The report is inserted inside a savepoint: if it fails, none of its rows are kept and the error is raised.\n
+
+    <b>Parameters:</b>\n
+    con (sqlite3.Connection): Connection with the database that contains the daily_quotas table.\n
+    informes (list): List of pandas dataframes with the parts of the report, as returned by the _informe_parts function.\n
+    chunksize (int): Default = 10000. Number of rows sent to the database in each executemany call.\n
+
+    <b>Returns:</b>\n
+    Theres no return from the function.
+
+   """
+    cursor = con.cursor()
+    cursor.execute('SAVEPOINT "report"')
+    try:
+        for informe in informes:
+            #the rows are built straight from the columns numpy arrays, chunk by chunk, avoiding a copy of the dataframe
+            #and the creation of a pandas object for every cell
+            #a report has only a few distinct dates, so only those are formatted (same text format written by to_sql)
+            #and the rows take them by code. Missing dates (code -1) take the None appended at the end
+            codes, dates = pd.factorize(informe['DT_COMPTC'])
+            dates = np.append(dates.strftime('%Y-%m-%d %H:%M:%S').to_numpy(dtype = object), None)[codes]
+            arrays = [dates if col == 'DT_COMPTC' else informe[col].to_numpy() for col in informe.columns]
+
+            insert = 'INSERT INTO "daily_quotas" ({}) VALUES ({})'.format(','.join(f'"{col}"' for col in informe.columns),
+                                                                           ','.join('?' * len(informe.columns)))
+            for start in range(0, len(informe), chunksize):
+                cursor.executemany(insert, zip(*[array[start:start + chunksize].tolist() for array in arrays]))
+    except sqlite3.Error:
+        cursor.execute('ROLLBACK TO "report"')
+        raise
+    finally:
+        cursor.execute('RELEASE "report"')
+        cursor.close()
+
+
+def _load_reports(con: sqlite3.Connection, reports: list, target_funds: list = []) -> list:
+    """Downloads the given daily reports from the CVM website and pushes them to the daily_quotas table, in a single transaction.\n
+    The downloads run in parallel threads, while the inserts stay in the calling thread (sqlite connections can't be shared between threads).
+    At most _MAX_PENDING_REPORTS reports are downloaded or waiting to be inserted at the same time.
+    Reports that fail to be downloaded, parsed or inserted are skipped and listed at the end, while the others are still committed.\n
+
+    <b>Parameters:</b>\n
+    con (sqlite3.Connection): Connection with the database that contains the daily_quotas table.\n
+    reports (list): List of (year, month) tuples with the reports to be downloaded.\n
+    target_funds (list): Opitional (Defaults to []). List of target funds CNPJs. If not empty, only these funds are pushed to the database.\n
+
+    <b>Returns:</b>\n
+    list: List of dicts (year, month and error) with the reports that could not be downloaded or inserted. Empty if all of them were loaded.
+
+   """
+    #all the reports are inserted in a single transaction, committed after the last one
+    con.execute('BEGIN')
+    failed = [] #log of the reports that could not be downloaded or inserted
+
+    with ThreadPoolExecutor(max_workers = _DOWNLOAD_WORKERS) as executor, tqdm(total = len(reports), position = 0, leave=True) as progress:
+        #the yearly reports are pushed file by file, so they are never concatenated in memory
+        #if the target funds list is not empty, it is used to filter the reports while they are read
+        submit = lambda year, mth: executor.submit(_informe_parts, year, mth, target_funds = target_funds)
+
+        #only a limited number of reports is in flight: a new download is submitted each time one finishes
+        pending = iter(reports)
+        futures = {submit(year, mth): (year, mth) for year, mth in islice(pending, _MAX_PENDING_REPORTS)}
+        while futures:
+            done, _ = wait(futures, return_when = FIRST_COMPLETED)
+            for future in done:
+                year, mth = futures.pop(future) #dropping the future releases the report from memory once it is pushed
+                for next_year, next_mth in islice(pending, 1):
+                    futures[submit(next_year, next_mth)] = (next_year, next_mth)
+                progress.update(1)
+
+                try:
+                    informes = future.result()
+                except Exception as error: #connection errors, timeouts, server errors and malformed files
+                    failed.append({'year': year, 'month': mth, 'error': f'{type(error).__name__}: {error}'})
+                    continue
+
+                if informes is None: #theres no report for this date yet
+                    continue
+                #appends information to the sql database, logging the failures and moving on to the next report
+                try:
+                    _insert_daily_quotas(con, informes)
+                except sqlite3.Error as error:
+                    failed.append({'year': year, 'month': mth, 'error': str(error)})
+
+    con.commit()
+
+    if failed:
+        print('the following reports could not be downloaded or inserted in the database: \n')
+        print(pd.DataFrame(failed).to_string(index = False), '\n')
+    return failed
+
+
+def _update_cad_fi(con: sqlite3.Connection, target_funds: list = []) -> bool:
+    """Downloads the cadastral information of the funds from the CVM website and pushes it to the info_cadastral_funds table.\n
+    The ETag and Last-Modified headers of the file are kept in the http_cache table and sent back in the next call,
+    so the file is only downloaded again when it changes in the CVM website.\n
+
+    <b>Parameters:</b>\n
+    con (sqlite3.Connection): Connection with the database.\n
+    target_funds (list): Opitional (Defaults to []). List of target funds CNPJs. If not empty, only these funds are kept.\n
+
+    <b>Returns:</b>\n
+    bool: True if the table was updated, False if the file didn't change since the last download.
+
+   """
+    url = 'http://dados.cvm.gov.br/dados/FI/CAD/DADOS/cad_fi.csv'
+    con.execute('CREATE TABLE IF NOT EXISTS "http_cache" ("url" TEXT PRIMARY KEY, "etag" TEXT, "last_modified" TEXT)')
+
+    #sends the validators of the last download, if the table it was pushed to still exists
+    headers = {}
+    cached = con.execute('SELECT etag, last_modified FROM http_cache WHERE url = ?', (url,)).fetchone()
+    has_table = con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", ('info_cadastral_funds',)).fetchone()
+    if cached and has_table:
+        if cached[0]:
+            headers['If-None-Match'] = cached[0]
+        if cached[1]:
+            headers['If-Modified-Since'] = cached[1]
+
+    r = _SESSION.get(url, headers = headers, timeout = 30)
+    if r.status_code == 304: #the file didn't change since the last download
+        return False
+    r.raise_for_status()
+
+    info_cad = pd.read_csv(io.BytesIO(r.content), sep = ';', encoding='latin1',
+                           dtype = {'RENTAB_FUNDO': object,'FUNDO_EXCLUSIVO': object, 'TRIB_LPRAZO': object, 'ENTID_INVEST': object,
+                                    'INF_TAXA_PERFM': object, 'INF_TAXA_ADM': object, 'DIRETOR': object, 'CNPJ_CONTROLADOR': object,
+                                    'CONTROLADOR': object}
+                            )
+    if target_funds:
+        info_cad = info_cad[info_cad.CNPJ_FUNDO.isin(target_funds)]
+    info_cad.to_sql('info_cadastral_funds', con, if_exists='replace', index=False)
+
+    #the validators are only stored once the table is written
+    con.execute('INSERT OR REPLACE INTO http_cache (url, etag, last_modified) VALUES (?, ?, ?)',
+                (url, r.headers.get('ETag'), r.headers.get('Last-Modified')))
+    con.commit()
+    return True
+
+
+def _selic_rates(start: datetime.date = None, end: datetime.date = None) -> pd.DataFrame:
+    """Downloads the daily selic rates (basic interest rate of the brazilian economy) from the Brazilian Central Bank api, through the shared http session.\n
+
+    <b>Parameters:</b>\n
+    start (datetime.date): Opitional (Defaults to None). First date of the rates. If None, the whole series is downloaded.\n
+    end (datetime.date): Opitional (Defaults to None). Last date of the rates. Only used together with start.\n
+
+    <b>Returns:</b>\n
+    pd.DataFrame: Pandas dataframe with the date and the decimal rate of each day.
+
+   """
+    params = {'formato': 'json'}
+    if start is not None:
+        params.update({'dataInicial': start.strftime('%d/%m/%Y'), 'dataFinal': end.strftime('%d/%m/%Y')})
+
+    r = _SESSION.get('http://api.bcb.gov.br/dados/serie/bcdata.sgs.{}/dados'.format(11), params = params, timeout = 30)
+    if r.status_code == 404 and start is not None: #the api answers with not found when there are no rates in the period
+        return pd.DataFrame({'date': pd.Series(dtype = 'datetime64[ns]'), 'rate': pd.Series(dtype = np.float64)})
+    r.raise_for_status()
+
+    #the payload has a fixed schema, so the records are loaded directly instead of through the generic json reader
+    selic = pd.DataFrame.from_records(r.json(), columns = ['data', 'valor'])
+    selic['data'] = pd.to_datetime(selic['data'], format = '%d/%m/%Y', cache = True)
+    selic['valor'] = pd.to_numeric(selic['valor'])/100 #calculates decimal rate from the percentual value
+    return selic.rename(columns = {'data':'date', 'valor':'rate'})
 
 
 def start_db(db_dir: str = 'investments_database.db', start_year: int = 2005, target_funds: list = []):
@@ -107,38 +353,38 @@ def start_db(db_dir: str = 'investments_database.db', start_year: int = 2005, ta
     print (f'creating SQLite database: {db_dir} \n')
     con = sqlite3.connect(db_dir)
 
+    #tunes the connection for the bulk load: the whole database is built in a single run, so durability
+    #of each intermediate write is not needed (a failed run has to be restarted anyway)
+    con.execute('PRAGMA journal_mode=WAL')
+    con.execute('PRAGMA synchronous=OFF')
+    con.execute('PRAGMA temp_store=MEMORY')
+    con.execute('PRAGMA cache_size=-262144') #256Mb of page cache
+
+    table = '''
+    CREATE TABLE IF NOT EXISTS "daily_quotas" (
+        "CNPJ_FUNDO" TEXT,
+        "DT_COMPTC" TIMESTAMP,
+        "VL_TOTAL" REAL,
+        "VL_QUOTA" REAL,
+        "VL_PATRIM_LIQ" REAL,
+        "CAPTC_DIA" REAL,
+        "RESG_DIA" REAL,
+        "NR_COTST" INTEGER
+    )'''
+    con.execute(table)
+
 
     ##STEP 2:
     #downloads each report in the cvm website and pushes it to the sql database daily_quotas table
     print('downloading daily reports from the CVM website... \n')
 
-    #for each year between 2017 and now
-    for year in tqdm(range(start_year, datetime.date.today().year + 1), position = 0, leave=True): 
-        for mth in range(1, 13): #for each month
-            #loop structure for years equal or after 2017
-            if year>=2017: 
-                informe = cvm_informes(str(year), mth)
+    #lists the reports to be downloaded. Before 2017 there is a single file for the whole year
+    current = datetime.date.today()
+    reports = [(year, 12) for year in range(start_year, 2017)]
+    reports += [(year, mth) for year in range(max(start_year, 2017), current.year + 1) for mth in range(1, 13)
+                if (year, mth) <= (current.year, current.month)]
 
-                try:
-                    if target_funds: #if the target funds list is not empty, uses it to filter the result set
-                        informe = informe[informe.CNPJ_FUNDO.isin(target_funds)]
-                    #appends information to the sql database
-                    informe.to_sql('daily_quotas', con , if_exists = 'append', index=False)
-                except AttributeError:
-                    pass
-            
-            elif year<2017: #loop structure to handle years before 2017 (they have a different file structure)
-                #only executes the download function once every year to avoid duplicates (unique file for each year)       
-                if mth == 12:
-                    informe = cvm_informes(str(year), mth)
-
-                    try:
-                        if target_funds: #if the target funds list is not empty, uses it to filter the result set
-                            informe = informe[informe.CNPJ_FUNDO.isin(target_funds)]
-                        #appends information to the sql database
-                        informe.to_sql('daily_quotas', con , if_exists = 'append', index=False)
-                    except AttributeError:
-                        pass
+    _load_reports(con, reports, target_funds)
 
     #pushes target funds to sql for use when updating the database
     if target_funds:
@@ -148,14 +394,9 @@ def start_db(db_dir: str = 'investments_database.db', start_year: int = 2005, ta
     #creates index in the daily_quotas table to make future select queries faster. 
     #tradeoff: The updating proceesses of the database will be slower.
     print('creating sql index on "CNPJ_FUNDO", "DT_COMPTC" ... \n')
-    index = '''
-    CREATE INDEX "cnpj_date" ON "daily_quotas" (
-        "CNPJ_FUNDO" ASC,
-        "DT_COMPTC" ASC
-    )'''
-
     cursor = con.cursor()
-    cursor.execute(index)
+    cursor.execute(_CNPJ_DATE_INDEX)
+    cursor.execute('ANALYZE "daily_quotas"') #gathers the table statistics used by the query planner
     con.commit()
 
     cursor.close()
@@ -164,14 +405,7 @@ def start_db(db_dir: str = 'investments_database.db', start_year: int = 2005, ta
     ##STEP 4:
     #downloads cadastral information from CVM of the fundos and pushes it to the database
     print('downloading cadastral information from cvm...\n')
-    info_cad = pd.read_csv('http://dados.cvm.gov.br/dados/FI/CAD/DADOS/cad_fi.csv', sep = ';', encoding='latin1',
-                           dtype = {'RENTAB_FUNDO': object,'FUNDO_EXCLUSIVO': object, 'TRIB_LPRAZO': object, 'ENTID_INVEST': object,
-                                    'INF_TAXA_PERFM': object, 'INF_TAXA_ADM': object, 'DIRETOR': object, 'CNPJ_CONTROLADOR': object,
-                                    'CONTROLADOR': object}
-                            )
-    if target_funds:
-        info_cad = info_cad[info_cad.CNPJ_FUNDO.isin(target_funds)]
-    info_cad.to_sql('info_cadastral_funds', con, index=False)
+    _update_cad_fi(con, target_funds)
 
 
     ##STEP 5:
@@ -180,7 +414,7 @@ def start_db(db_dir: str = 'investments_database.db', start_year: int = 2005, ta
     today = (datetime.date.today() + datetime.timedelta(1)).strftime('%Y-%m-%d')
     ibov = pd.DataFrame(YahooFinancials('^BVSP').get_historical_price_data('1990-09-15', today, 'daily')['^BVSP']['prices'])
     ibov = ibov.drop(columns=['date', 'close']).rename(columns={'formatted_date':'date', 'adjclose':'close'}).iloc[:,[5,0,1,2,3,4]]
-    ibov['date'] = pd.to_datetime(ibov['date'])
+    ibov['date'] = pd.to_datetime(ibov['date'], format = '%Y-%m-%d')
     ibov.columns = [i.capitalize() for i in ibov.columns] #capitalizes columns to keep consistency with previous format (investpy)
     ibov.to_sql('ibov_returns', con, index=False) 
 
@@ -189,16 +423,10 @@ def start_db(db_dir: str = 'investments_database.db', start_year: int = 2005, ta
     #downloads daily selic returns (basic interest rate of the brazilian economy) 
     #from the brazillian central bank and pushes it to the database
     print('downloading selic rates from the Brazilian Central Bank website...\n')
-    selic = pd.read_json('http://api.bcb.gov.br/dados/serie/bcdata.sgs.{}/dados?formato=json'.format(11))
-    selic['data'] = pd.to_datetime(selic['data'], format = '%d/%m/%Y')
-    selic['valor'] = selic['valor']/100 #calculates decimal rate from the percentual value
-
-    #calculates asset "price" considering day 0 price as 1
-    selic.loc[0,'price'] = 1 * (1 + selic.loc[0,'valor'])
-    for i in range(1, len(selic)):
-        selic.loc[i, 'price'] = selic.loc[i-1, 'price'] * (1 + selic.loc[i,'valor'])
+    selic = _selic_rates()
 
-    selic.rename(columns = {'data':'date', 'valor':'rate'}, inplace = True)
+    #calculates asset "price" considering day 0 price as 1, as the cumulative product of the daily returns
+    selic['price'] = np.cumprod(1 + selic['rate'].to_numpy())
     selic.to_sql('selic_rates', con , index=False)  
 
 
@@ -211,6 +439,7 @@ def start_db(db_dir: str = 'investments_database.db', start_year: int = 2005, ta
 
     ##STEP 8
     #closes the connection with the database
+    con.execute('PRAGMA optimize') #refreshes the query planner statistics if needed
     con.close()
     print('connection with the database closed! \n')
 
@@ -232,6 +461,13 @@ def update_db(db_dir: str = r'investments_database.db'):
     print(f'connected with the database {db_dir}\n')
     con = sqlite3.connect(db_dir)
 
+    #tunes the connection for the bulk inserts. Unlike start_db, the database already holds data,
+    #so synchronous=NORMAL is used: with WAL it is still safe against corruption, only skipping most fsyncs
+    con.execute('PRAGMA journal_mode=WAL')
+    con.execute('PRAGMA synchronous=NORMAL')
+    con.execute('PRAGMA temp_store=MEMORY')
+    con.execute('PRAGMA cache_size=-262144') #256Mb of page cache
+
 
     ##STEP 2
     #calculates relevant date limits to the update process
@@ -252,7 +488,13 @@ def update_db(db_dir: str = r'investments_database.db'):
               'ibov_returns' : ['Date',last_update.strftime("%Y-%m-%d")]}
     
     cursor = con.cursor()
-    
+
+    #for long updates, the index is dropped and rebuilt at the end, which is faster than updating it
+    #for every deleted and inserted row
+    rebuild_index = num_months > _INDEX_REBUILD_MONTHS
+    if rebuild_index:
+        cursor.execute('DROP INDEX IF EXISTS "cnpj_date"')
+
     #sql delete statement to the database
     cursor.execute('delete from daily_quotas where DT_COMPTC >= :date', {'date': last_quota.strftime("%Y-%m-01")})
     cursor.execute('delete from ibov_returns where Date >= :date', {'date': last_update.strftime("%Y-%m-%d")})
@@ -272,68 +514,271 @@ def update_db(db_dir: str = r'investments_database.db'):
     
     print('downloading new daily reports from the CVM website...\n')
     # downloads the daily cvm repport for each month between the last update and today
-    for m in range(num_months+1): 
-        data_alvo = last_quota + relativedelta(months=+m) 
-        informe = cvm_informes(data_alvo.year, data_alvo.month)
-        if target_funds:
-            informe = informe[informe.CNPJ_FUNDO.isin(target_funds)]
-        try:
-            informe.to_sql('daily_quotas', con , if_exists = 'append', index=False)
-        except AttributeError:
-            pass 
+    months = [last_quota + relativedelta(months=+m) for m in range(num_months+1)]
+    failed = _load_reports(con, [(data_alvo.year, data_alvo.month) for data_alvo in months], target_funds)
+
+    #the index is created whenever it is missing, not only after a rebuild, so an update that failed
+    #after dropping it doesn't leave the database without it
+    if rebuild_index:
+        print('recreating sql index on "CNPJ_FUNDO", "DT_COMPTC" ... \n')
+    con.execute(_CNPJ_DATE_INDEX)
+    if rebuild_index:
+        con.execute('ANALYZE "daily_quotas"') #gathers the table statistics used by the query planner
+    con.commit()
 
     #downloads cadastral information from CVM of the fundos and pushes it to the database
     print('downloading updated cadastral information from cvm...\n')
-    info_cad = pd.read_csv('http://dados.cvm.gov.br/dados/FI/CAD/DADOS/cad_fi.csv', sep = ';', encoding='latin1',
-                           dtype = {'RENTAB_FUNDO': object,'FUNDO_EXCLUSIVO': object, 'TRIB_LPRAZO': object, 'ENTID_INVEST': object,
-                                    'INF_TAXA_PERFM': object, 'INF_TAXA_ADM': object, 'DIRETOR': object, 'CNPJ_CONTROLADOR': object,
-                                    'CONTROLADOR': object}
-                            )
-    if target_funds: #filters target funds if they were specified when building the database.
-        info_cad = info_cad[info_cad.CNPJ_FUNDO.isin(target_funds)]
-    info_cad.to_sql('info_cadastral_funds', con, if_exists='replace', index=False)
+    #filters target funds if they were specified when building the database.
+    if not _update_cad_fi(con, target_funds):
+        print('the cadastral information did not change since the last update.\n')
 
-    #updates daily interest returns (selic)
+    #updates daily interest returns (selic), downloading only the rates after the last one in the database
     print('updating selic rates...\n')
-    selic = pd.read_json('http://api.bcb.gov.br/dados/serie/bcdata.sgs.{}/dados?formato=json'.format(11))
-    selic['data'] = pd.to_datetime(selic['data'], format = '%d/%m/%Y')
-    selic['valor'] = selic['valor']/100 #calculates decimal rate from the percentual value
-
-    #calculates asset "price" considering day 0 price as 1
-    selic.loc[0,'price'] = 1 * (1 + selic.loc[0,'valor'])
-    for i in range(1, len(selic)):
-        selic.loc[i, 'price'] = selic.loc[i-1, 'price'] * (1 + selic.loc[i,'valor'])
+    last_selic = con.execute('select date, price from selic_rates order by date desc limit 1').fetchone()
+    last_date, last_price = pd.to_datetime(last_selic[0]), last_selic[1]
 
-    selic.rename(columns = {'data':'date', 'valor':'rate'}, inplace = True)
+    if last_date.date() < today:
+        selic = _selic_rates(last_date + datetime.timedelta(1), today)
+        selic = selic[selic['date'] > last_date].reset_index(drop = True) #filters only new data
 
-    #filters only new data
-    selic = selic[selic.date>=(last_update + datetime.timedelta(-1))]
-    selic.to_sql('selic_rates', con , if_exists = 'append', index=False) 
+        if len(selic):
+            #continues the asset "price" from the last price in the database, as the cumulative product of the daily returns
+            selic['price'] = last_price * np.cumprod(1 + selic['rate'].to_numpy())
+            selic.to_sql('selic_rates', con , if_exists = 'append', index=False) 
 
     #updates ibovespa data
     print('updating ibovespa returns...\n')
     today = (datetime.date.today() + datetime.timedelta(1)).strftime('%Y-%m-%d')
     ibov = pd.DataFrame(YahooFinancials('^BVSP').get_historical_price_data(last_update.strftime('%Y-%m-%d'), today, 'daily')['^BVSP']['prices'])
     ibov = ibov.drop(columns=['date', 'close']).rename(columns={'formatted_date':'date', 'adjclose':'close'}).iloc[:,[5,0,1,2,3,4]]
-    ibov['date'] = pd.to_datetime(ibov['date'])
+    ibov['date'] = pd.to_datetime(ibov['date'], format = '%Y-%m-%d')
     ibov.columns = [i.capitalize() for i in ibov.columns] #capitalizes columns to keep consistency with previous format (investpy)
     ibov.to_sql('ibov_returns', con , if_exists = 'append', index=False)
 
     ##STEP 5
-    #updates the log in the database
-    print('updating the log...\n')
-    update_log = pd.DataFrame({'date':[datetime.datetime.now()], 'log':[1]})
-    update_log.to_sql('update_log', con, if_exists = 'append', index=False)
+    #updates the log in the database. If some report failed, the log is kept at the last update, so the next
+    #update starts from the same month and reloads the reports deleted in STEP 3
+    if failed:
+        print('some daily reports could not be loaded, the log was not updated. Run update_db again to reload them.\n')
+    else:
+        print('updating the log...\n')
+        update_log = pd.DataFrame({'date':[datetime.datetime.now()], 'log':[1]})
+        update_log.to_sql('update_log', con, if_exists = 'append', index=False)
 
 
     ##STEP 6
     #closes the connection with the database
+    con.execute('PRAGMA optimize') #refreshes the query planner statistics if needed
     con.close()
     print('connection with the database closed!\n')
 
     print(f'database {db_dir} updated!\n')
 
 
+def _group_runs(groups: pd.Series) -> tuple:
+    """Finds the contiguous runs of rows of each group, sorting the rows by group only when they are not contiguous already.\n
+
+    <b>Parameters:</b>\n
+    groups (pd.Series): group of each row (example: the funds CNPJs).\n
+
+    <b>Returns:</b>\n
+    tuple: (order, starts). order is the stable sort of the rows that makes each group contiguous, or None if the groups already are. starts is the position of the first row of each run in the sorted rows.
+
+   """
+    keys = groups.to_numpy()
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.array([], dtype = np.int64)
+
+    #data sorted by group (as the cvm reports after an ordered query) has one run per group, so the sort is skipped.
+    #the runs are found comparing each row with the previous one, and only the key of each run is hashed
+    if pd.Index(keys[starts]).is_unique:
+        return None, starts
+
+    #the stable sort keeps the order of the rows inside the groups
+    codes = pd.factorize(groups)[0]
+    order = np.argsort(codes, kind = 'stable')
+    codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    return order, starts
+
+
+def _run_rolling_sum(values: np.ndarray, starts: np.ndarray, window_size: int) -> np.ndarray:
+    """Calculates rolling window sums of the columns of an array whose groups are contiguous runs of rows.\n
+    Windows with less than window_size valid values return NaN, as in the pandas rolling(window_size).sum(). Infinite values count as missing.\n
+
+    <b>Parameters:</b>\n
+    values (np.ndarray): 2d float array with the values to be summed, sorted by group.\n
+    starts (np.ndarray): position of the first row of each group, as returned by _group_runs.\n
+    window_size (int): size of the rolling window.\n
+
+    <b>Returns:</b>\n
+    np.ndarray: 2d array with the rolling sums, in the same row order as the values array.
+
+   """
+    n_rows, n_cols = values.shape
+    if n_rows == 0:
+        return values.copy()
+
+    #each group is preceded by a separator row that takes out the total of the previous group, so the cumulative
+    #sums restart in every group and keep the precision of its own values, whatever was summed before it.
+    #the separators hold no valid values, so any window that crosses the start of a group is left incomplete.
+    #infinite values are taken as missing, otherwise they would turn the separator infinite and every later group NaN
+    valid = np.isfinite(values)
+    filled = np.where(valid, values, 0)
+    separators = np.zeros((len(starts), n_cols))
+    separators[1:] = -np.add.reduceat(filled, starts, axis = 0)[:-1]
+    cum_sum = np.cumsum(np.insert(filled, starts, separators, axis = 0), axis = 0)
+    cum_count = np.cumsum(np.insert(valid, starts, False, axis = 0), axis = 0, dtype = np.int64)
+
+    #the sum of each window is the difference between the cumulative sums at its edges.
+    #windows with missing values are discarded
+    sums = np.full_like(cum_sum, np.nan)
+    full_window = (cum_count[window_size:] - cum_count[:-window_size]) == window_size
+    sums[window_size:] = np.where(full_window, cum_sum[window_size:] - cum_sum[:-window_size], np.nan)
+    return np.delete(sums, starts + np.arange(len(starts)), axis = 0) #drops the separators
+
+
+def _grouped_rolling_sum(values: np.ndarray, groups: pd.Series, window_size: int) -> np.ndarray:
+    """Calculates rolling window sums of the columns of an array inside each group, in a single vectorized pass over all the groups.\n
+    Windows with less than window_size valid values return NaN, as in the pandas rolling(window_size).sum().\n
+
+    <b>Parameters:</b>\n
+    values (np.ndarray): 2d array with the values to be summed, one column for each series.\n
+    groups (pd.Series): group of each row of the values array (example: the funds CNPJs). The rows of each group must be in chronological order.\n
+    window_size (int): size of the rolling window.\n
+
+    <b>Returns:</b>\n
+    np.ndarray: 2d array with the rolling sums, in the same row order as the values array.
+
+   """
+    #each group becomes a contiguous run of rows
+    order, starts = _group_runs(groups)
+    values = np.asarray(values, dtype = np.float64)
+    if order is None:
+        return _run_rolling_sum(values, starts, window_size)
+
+    #restores the original order of the rows
+    out = np.empty_like(values)
+    out[order] = _run_rolling_sum(values[order], starts, window_size)
+    return out
+
+
+def _grouped_sum(values: np.ndarray, groups: pd.Series) -> tuple:
+    """Sums the columns of an array inside each group, skipping NaNs as the pandas groupby sum.\n
+    The groups are reduced as contiguous runs of rows with np.add.reduceat, in the order they first appear (as groupby(sort = False)). Rows without a group are dropped.\n
+
+    <b>Parameters:</b>\n
+    values (np.ndarray): 2d array with the values to be summed, one column for each series.\n
+    groups (pd.Series): group of each row of the values array (example: the funds CNPJs).\n
+
+    <b>Returns:</b>\n
+    tuple: (keys, sums). keys is the array with the groups and sums the 2d array with the sums of each group.
+
+   """
+    order, starts = _group_runs(groups)
+    keys = groups.to_numpy()
+    x = np.asarray(values)
+    if order is not None:
+        keys, x = keys[order], x[order]
+    if not len(starts):
+        return keys[:0], np.zeros((0, ) + x.shape[1:], dtype = x.dtype)
+
+    sums = np.add.reduceat(np.where(np.isnan(x), 0, x) if x.dtype.kind == 'f' else x, starts, axis = 0)
+    keys = keys[starts]
+    has_group = pd.notna(keys)
+    return keys[has_group], sums[has_group]
+
+
+def _grouped_pct_change(values: np.ndarray, groups: pd.Series, periods: int) -> np.ndarray:
+    """Calculates the percentual change of the columns of an array over a number of periods inside each group, as the pandas groupby pct_change.\n
+    The first periods rows of each group return NaN, as the rows without a group (dropped by the pandas groupby).\n
+
+    <b>Parameters:</b>\n
+    values (np.ndarray): 2d array with the values, one column for each series.\n
+    groups (pd.Series): group of each row of the values array (example: the funds CNPJs). The rows of each group must be in chronological order.\n
+    periods (int): number of periods (rows) over which the change is calculated.\n
+
+    <b>Returns:</b>\n
+    np.ndarray: 2d array with the percentual changes, in the same row order as the values array.
+
+   """
+    order, starts = _group_runs(groups)
+    x = np.asarray(values)
+    if order is not None:
+        x = x[order]
+
+    #inside each contiguous run, the change is the division of each row by the row periods positions above it.
+    #rows whose base would belong to the previous group are left as NaN
+    changes = np.full(x.shape, np.nan, dtype = np.result_type(x.dtype, np.float32))
+    if len(x) > periods:
+        group_start = np.zeros(len(x), dtype = np.int64)
+        group_start[starts] = starts
+        in_group = (np.arange(periods, len(x)) - np.maximum.accumulate(group_start)[periods:]) >= periods
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            changes[periods:] = np.where(in_group[:, None], x[periods:] / x[:-periods] - 1, np.nan)
+
+    keys = groups.to_numpy() if order is None else groups.to_numpy()[order]
+    changes[pd.isna(keys)] = np.nan
+
+    if order is None:
+        return changes
+
+    #restores the original order of the rows
+    out = np.empty_like(changes)
+    out[order] = changes
+    return out
+
+
+def _grouped_rolling_std(values: np.ndarray, groups: pd.Series, window_size: int) -> np.ndarray:
+    """Calculates the rolling window standard deviation (with degree of freedom = 0) of the columns of an array inside each group.\n
+    Windows with less than window_size valid values return NaN, as in the pandas rolling(window_size).std(ddof=0).\n
+
+    <b>Parameters:</b>\n
+    values (np.ndarray): 2d array with the values, one column for each series.\n
+    groups (pd.Series): group of each row of the values array (example: the funds CNPJs). The rows of each group must be in chronological order.\n
+    window_size (int): size of the rolling window.\n
+
+    <b>Returns:</b>\n
+    np.ndarray: 2d array with the rolling standard deviations, in the same row order as the values array.
+
+   """
+    order, starts = _group_runs(groups)
+    x = np.asarray(values, dtype = np.float64)
+    if order is not None:
+        x = x[order]
+    if len(x) == 0:
+        return x.copy()
+
+    #centers the values on the mean of their group, so the variance is not lost in the subtraction of the squared mean.
+    #infinite values are left out of the mean, and the windows that contain them return NaN
+    valid = np.isfinite(x)
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        means = np.add.reduceat(np.where(valid, x, 0), starts, axis = 0) / np.add.reduceat(valid, starts, axis = 0)
+    centered = x - np.repeat(np.nan_to_num(means), np.diff(np.append(starts, len(x))), axis = 0)
+
+    #the variance of each window comes from the rolling sums of the values and of their squares
+    n_cols = x.shape[1]
+    sums = _run_rolling_sum(np.hstack([centered, centered * centered]), starts, window_size) / window_size
+    std = np.sqrt(np.maximum(sums[:, n_cols:] - sums[:, :n_cols] ** 2, 0))
+
+    #windows of a single repeated value get a zero standard deviation, as in pandas, instead of the rounding
+    #noise of the subtraction. a window is constant when no value differs from the previous one inside it
+    if window_size == 1:
+        constant = np.ones_like(valid)
+    else:
+        changed = np.ones(x.shape)
+        changed[1:] = x[1:] != x[:-1]
+        constant = _run_rolling_sum(changed, starts, window_size - 1) == 0
+    std[constant & ~np.isnan(std)] = 0
+
+    if order is None:
+        return std
+
+    #restores the original order of the rows
+    out = np.empty_like(std)
+    out[order] = std
+    return out
+
+
 def returns(df: pd.DataFrame, group: str = 'CNPJ_FUNDO', values: list = ['VL_QUOTA'], rolling: bool = False, window_size: int = 1) -> pd.DataFrame:
     """Calculates the % returns for the given assets both in rolling windows or for the full available period (you also get the CAGR in this case).\n
 
@@ -355,10 +800,12 @@ def returns(df: pd.DataFrame, group: str = 'CNPJ_FUNDO', values: list = ['VL_QUO
     returns = df.copy(deep=True)
     for col in values:
         returns = returns[returns[col]>0]
-    returns.loc[:, values] = returns.loc[:, values].fillna(method = 'backfill')
+    returns.loc[:, values] = returns.loc[:, values].bfill()
 
     #calculates the percentual change in the rolling windows specified for each group
-    returns = returns.groupby(group, sort = False, as_index = True)[values].apply(lambda x: x.pct_change(window_size))
+    groups = returns[group]
+    returns = pd.DataFrame(_grouped_pct_change(returns[values].to_numpy(), returns[group], window_size),
+                           index = returns.index, columns = values)
     
     #renames the columns
     col_names = [(value + '_return_' + str(window_size) + 'd') for value in values]
@@ -366,20 +813,23 @@ def returns(df: pd.DataFrame, group: str = 'CNPJ_FUNDO', values: list = ['VL_QUO
 
     #if the parameter rolling = False, returns the original data with the added rolling returns
     if rolling:
-        df2 = df.merge(returns, how='left', left_index=True, right_index=True)
+        #the returns keep the index of the original data, so the columns are aligned by index without a merge
+        df2 = df.copy(deep = False)
+        for col in col_names:
+            df2[col] = returns[col]
         return df2
 
     #if the parameter rolling = True, returns the total compound returns in the period, the number of days
     # and the Compound Annual Growth Rate (CAGR)
     if not rolling: 
-        returns = df[[group]].merge(returns, left_index = True, right_index = True)
-        
-        #calculates the compound returns
-        returns = returns.groupby(group, sort = False, as_index = True).apply(lambda x: np.prod(1+x) - 1)
+        #calculates the compound returns, as the exponential of the sum of the log returns of each group
+        keys, sums = _grouped_sum(np.log1p(returns.to_numpy()), groups)
+        returns = pd.DataFrame(np.expm1(sums), index = pd.Index(keys, name = group), columns = returns.columns)
         
         #calculates the number of days in the period
-        n_observations =  df.groupby(group, sort = False, as_index = True)[values[0]].count()
-        returns = returns.merge(n_observations, left_index = True, right_index = True)
+        #both results are indexed by group, so the counts are aligned by index without a merge
+        keys, days = _grouped_sum(df[values[0]].notnull().to_numpy(dtype = np.int64)[:, None], df[group])
+        returns['days'] = pd.Series(days[:, 0], index = keys)
         
         #renames the columns in the result set
         col_names = [(value + '_cum_return') for value in values]
@@ -389,9 +839,13 @@ def returns(df: pd.DataFrame, group: str = 'CNPJ_FUNDO', values: list = ['VL_QUO
         #calculates the Compound Annual Growth Rate (CAGR)
         values = col_names[:-1]        
         col_names = [i.replace('_cum_return', '_cagr') for i in values]
-        returns[col_names] = (returns.dropna()
-                                     .loc[:,values]
-                                     .apply(lambda x: ((x + 1)**(252/returns.days))-1))
+        #in a single vectorized power over all the columns. Groups with missing returns get no CAGR
+        cagr = returns[values].to_numpy() + 1
+        np.power(cagr, 252/returns['days'].to_numpy()[:, None], out = cagr)
+        cagr -= 1
+        cagr[returns.isnull().any(axis = 1).to_numpy()] = np.nan
+        for i, col in enumerate(col_names):
+            returns[col] = cagr[:, i]
 
         return returns                                   
 
@@ -412,15 +866,17 @@ def cum_returns(df: pd.DataFrame, group: str = 'CNPJ_FUNDO', values: list = ['VL
    """
     returns_df = returns(df, group = group, values = values, rolling=True) #calculates  the daily returns
     
-    #calculates the cumulative returns in each day for each group
-    cum_returns = returns_df.groupby(group)[[value + '_return_1d' for value in values]].expanding().apply(lambda x: np.prod(x+1)-1)
+    #calculates the cumulative returns in each day for each group, as the cumulative product of the daily returns
+    return_cols = [value + '_return_1d' for value in values]
+    cum_returns = (1 + returns_df[return_cols]).groupby(returns_df[group], sort = False).cumprod() - 1
     
     #renames the columns
     cum_returns.columns = [i + '_cum_return' for i in values]
-    cum_returns.reset_index(level = 0, inplace = True)
 
-    cum_returns = returns_df.merge(cum_returns, how = 'right', on = group, left_index = True, right_index = True)
-    return cum_returns
+    #the cumulative returns keep the index of the daily returns, so the columns are added without a merge
+    for col in cum_returns.columns:
+        returns_df[col] = cum_returns[col].to_numpy()
+    return returns_df
 
 
 def volatility(df: pd.DataFrame, group: str = 'CNPJ_FUNDO', values: list = ['VL_QUOTA_return_1d'], rolling: bool = False ,returns_frequency: int = 1, window_size: int = 21) -> pd.DataFrame:
@@ -438,64 +894,67 @@ def volatility(df: pd.DataFrame, group: str = 'CNPJ_FUNDO', values: list = ['VL_
     pd.DataFrame: If rolling = False: Pandas dataframe with total volatility for the assets. If rolling = True: The original pandas dataframe with added columns for the volatility in the rolling windows.
 
    """
-    if not rolling:
-        vol = df.copy(deep=True)
-        for col in values:
-            vol = df[df[col].notnull()]
+    #uses only the periods with all the returns available
+    vol = df[df[values].notnull().all(axis = 1)]
 
+    if not rolling:
         vol = vol.groupby(group)[values].std(ddof=0) 
         
         #renames the columns
         col_names = [(value + '_vol') for value in values]        
         vol.columns = col_names
 
-        #annualizes the volatility
-        vol[col_names]= vol[col_names].apply(lambda x : x *((252/returns_frequency)**0.5))
+        #annualizes the volatility with a single vectorized multiplication
+        vol *= np.sqrt(252/returns_frequency)
         
         return vol
 
     if rolling: 
-        vol = df.copy(deep=True)
-        for col in values:
-            vol = df[df[col].notnull()]
-        
-        vol = (vol.groupby(group)[values]
-                  .rolling(window_size)
-                  .std(ddof=0) #standards deviation in the rolling period
-                  .reset_index(level = 0)
-                )
+        df2 = vol.copy(deep = False) #rows of the original data used in the calculation
+
+        #standards deviation in the rolling period, for all the groups in a single pass
+        vol = pd.DataFrame(_grouped_rolling_std(vol[values].to_numpy(), vol[group], window_size), index = vol.index)
+
         #renames the columns
         col_names = [(value + '_vol_' + str(window_size) + 'rw') for value in values]
-        col_names.insert(0, group)
         vol.columns = col_names
 
-        #annualizes the volatility
-        col_names.remove(group)
-        vol[col_names]= vol[col_names].apply(lambda x : x *((252/returns_frequency)**0.5))
+        #annualizes the volatility with a single vectorized multiplication
+        vol[col_names] = vol[col_names].to_numpy() * np.sqrt(252/returns_frequency)
 
-        df2 = df.merge(vol.drop(columns = group),left_index=True,right_index=True)
+        #the volatility keeps the index of the original data, so the columns are aligned by index without a merge
+        for col in col_names:
+            df2[col] = vol[col]
         return df2
     
     raise Exception("Wrong Parameter: rolling can only be True or False.")
   
 
-def drawdown(df: pd.DataFrame, group: str = 'CNPJ_FUNDO', values: list = ['VL_QUOTA'])-> pd.DataFrame:
+def drawdown(df: pd.DataFrame, group: str = 'CNPJ_FUNDO', values: list = ['VL_QUOTA'], inplace: bool = False)-> pd.DataFrame:
     """Calculates the drawdown (the % the asset is down from its all-time-high) for givens assets.\n
 
     <b>Parameters:</b>\n
     df (pd.DataFrame): Pandas dataframe with the needed data.\n
     group (str): name of the column in the dataframe used to group values. Example: 'stock_ticker' or 'fund_code'.\n
     values (list): names of the columns in the dataframe wich contains the asset and its benchmark prices. Example: ['asset_price', 'index price'].\n
+    inplace (bool): Opitional (Defaults to False). If True, adds the new columns to the given dataframe instead of to a shallow copy of it.\n
    
     <b>Returns:</b>\n
     pd.DataFrame: The original pandas dataframe with added columns for the all time high and drawdown of the given assets.
 
    """
-    df2 = df.copy(deep = True)
-    for value in values:
-        col = 'cum_max_'+ value
-        df2[col] = df2.groupby([group])[[value]].cummax().to_numpy() 
-        df2[('drawdown_'+ value)] = (df2[value]/df2[col])-1
+    #shallow copy: the new columns are added without duplicating the original data
+    df2 = df if inplace else df.copy(deep = False)
+
+    #calculates the all time high of every value column in a single groupby pass
+    cum_max = df2.groupby(group, sort = False)[values].cummax().to_numpy()
+
+    #calculates the drawdowns of all the columns with a single numpy division
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        drawdowns = df2[values].to_numpy() / cum_max - 1
+    for i, value in enumerate(values):
+        df2['cum_max_'+ value] = cum_max[:, i]
+        df2[('drawdown_'+ value)] = drawdowns[:, i]
     return df2
 
 
@@ -523,22 +982,27 @@ def corr_benchmark(df: pd.DataFrame,  asset_returns: str, index_returns: str, gr
         corr.columns=['correlation_benchmark']
         return corr
     if rolling:  
-        #calculates the correlation between the assests returns across rolling windows     
-        corr = (df[df[asset_returns].notnull()].groupby(group)[[asset_returns,index_returns]]
-                                              .rolling(window_size)
-                                              .corr() 
-                                              .xs(index_returns,level = 2, drop_level=True) #drops reduntant level of the corr matrix
-                                              .reset_index(level = 0)
-                                              .drop(columns=[index_returns])
-                                              .rename(columns = {asset_returns:'correlation_benchmark'})
-                )
-        df2 = df.merge(corr.drop(columns = [group]),left_index=True,right_index=True)
+        #calculates the correlation between the assests returns across rolling windows, using the closed formula of
+        #the pearson correlation over the rolling sums of the returns, their squares and their products
+        df2 = df[df[asset_returns].notnull()]
+        x = df2[asset_returns].to_numpy(dtype = np.float64)
+        y = df2[index_returns].to_numpy(dtype = np.float64)
+        with np.errstate(invalid = 'ignore', over = 'ignore'): #infinite returns give non-finite products, taken as missing
+            products = np.column_stack([x, y, x*y, x*x, y*y])
+        sx, sy, sxy, sxx, syy = _grouped_rolling_sum(products, df2[group], window_size).T
+
+        n = window_size
+        with np.errstate(invalid = 'ignore', divide = 'ignore'): #windows without variance have no correlation (NaN)
+            corr = (n*sxy - sx*sy) / np.sqrt((n*sxx - sx**2) * (n*syy - sy**2))
+
+        df2 = df2.copy(deep = False)
+        df2['correlation_benchmark'] = corr
         return df2
     
     raise Exception("Wrong Parameter: rolling can only be True or False") 
 
 
-def beta(df: pd.DataFrame, asset_vol: str, bench_vol: str, correlation: str = 'correlation_benchmark') -> pd.DataFrame:
+def beta(df: pd.DataFrame, asset_vol: str, bench_vol: str, correlation: str = 'correlation_benchmark', inplace: bool = False) -> pd.DataFrame:
     """Calculates the beta (measure of the volatility of an asset compared to the market, usually represented by a index benchmark) of the given assets.\n
 
     <b>Parameters:</b>\n
@@ -546,17 +1010,19 @@ def beta(df: pd.DataFrame, asset_vol: str, bench_vol: str, correlation: str = 'c
     asset_vol (str): name of the column in the dataframe with the assets volatilities.\n
     bench_vol (str): name of the column in the dataframe with the benchmark volatility.\n
     correlation (str): name of the column in the dataframe with the correlations between assets and their benchmarks.\n
+    inplace (bool): Opitional (Defaults to False). If True, adds the new column to the given dataframe instead of to a shallow copy of it.\n
 
     <b>Returns:</b>\n
     pd.DataFrame: The original pandas dataframe with an added column for the beta calculation.
 
    """
-    df2 = df.copy(deep = True)
-    df2['beta'] = (df2[asset_vol] / df2[bench_vol]) * df2[correlation]
+    df2 = df if inplace else df.copy(deep = False)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'): #zero volatilities give inf/NaN, as in pandas
+        df2['beta'] = (df2[asset_vol].to_numpy() / df2[bench_vol].to_numpy()) * df2[correlation].to_numpy()
     return df2
 
 
-def alpha(df: pd.DataFrame, asset_returns: str, bench_returns: str, riskfree_returns: str, beta: str) -> pd.DataFrame:
+def alpha(df: pd.DataFrame, asset_returns: str, bench_returns: str, riskfree_returns: str, beta: str, inplace: bool = False) -> pd.DataFrame:
     """Calculates the alpha (measure of the excess of return of an asset compared to the market, usually represented by a index benchmark) of the given assets.\n
 
     <b>Parameters:</b>\n
@@ -565,17 +1031,19 @@ def alpha(df: pd.DataFrame, asset_returns: str, bench_returns: str, riskfree_ret
     bench_returns (str): name of the column in the dataframe with the benchmark returns.\n
     riskfree_returns (str): name of the column in the dataframe with the risk free rate returns.\n
     beta (str): name of the column in the dataframe with the assets betas.\n
+    inplace (bool): Opitional (Defaults to False). If True, adds the new column to the given dataframe instead of to a shallow copy of it.\n
 
     <b>Returns:</b>\n
     pd.DataFrame: The original pandas dataframe with an added column for the alpha calculation.
 
    """
-    df2 = df.copy(deep = True)
-    df2['alpha'] = df2[asset_returns] - df2[riskfree_returns] - (df2[beta] * (df2[bench_returns] - df2[riskfree_returns]))
+    df2 = df if inplace else df.copy(deep = False)
+    riskfree = df2[riskfree_returns].to_numpy()
+    df2['alpha'] = df2[asset_returns].to_numpy() - riskfree - (df2[beta].to_numpy() * (df2[bench_returns].to_numpy() - riskfree))
     return df2
 
 
-def sharpe(df: pd.DataFrame, asset_returns: str, riskfree_returns: str, asset_vol: str) -> pd.DataFrame:
+def sharpe(df: pd.DataFrame, asset_returns: str, riskfree_returns: str, asset_vol: str, inplace: bool = False) -> pd.DataFrame:
     """Calculates the sharpe ratio (average return earned in excess of the risk-free rate per unit of volatility) of the given assets.\n
 
     <b>Parameters:</b>\n
@@ -583,18 +1051,20 @@ def sharpe(df: pd.DataFrame, asset_returns: str, riskfree_returns: str, asset_vo
     asset_returns (str): name of the column in the dataframe with the assets returns.\n
     riskfree_returns (str): name of the column in the dataframe with the risk free rate returns.\n 
     asset_vol (str): name of the column in the dataframe with the assets volatilities.\n
+    inplace (bool): Opitional (Defaults to False). If True, adds the new column to the given dataframe instead of to a shallow copy of it.\n
 
     <b>Returns:</b>\n
     pd.DataFrame: The original pandas dataframe with an added column for the sharpe calculation.
 
    """
 
-    df2 = df.copy(deep = True)
-    df2['sharpe'] = (df2[asset_returns] - df2[riskfree_returns]) / df2[asset_vol]
+    df2 = df if inplace else df.copy(deep = False)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        df2['sharpe'] = (df2[asset_returns].to_numpy() - df2[riskfree_returns].to_numpy()) / df2[asset_vol].to_numpy()
     return df2
 
 
-def sortino(df: pd.DataFrame, asset_returns: str, riskfree_returns: str, asset_negative_vol: str) -> pd.DataFrame:
+def sortino(df: pd.DataFrame, asset_returns: str, riskfree_returns: str, asset_negative_vol: str, inplace: bool = False, downcast: bool = False) -> pd.DataFrame:
     """Calculates the sortino ratio (average return earned in excess of the risk-free rate per unit of negative volatility) of the given assets.\n
 
     <b>Parameters:</b>\n
@@ -602,17 +1072,50 @@ def sortino(df: pd.DataFrame, asset_returns: str, riskfree_returns: str, asset_n
     asset_returns (str): name of the column in the dataframe with the assets returns.\n
     riskfree_returns (str): name of the column in the dataframe with the risk free rate returns.\n
     asset_negative_vol (str): name of the column in the dataframe with the assets downside volatilities (volatility of only negative returns).\n
+    inplace (bool): Opitional (Defaults to False). If True, adds the new column to the given dataframe instead of to a shallow copy of it.\n
+    downcast (bool): Opitional (Defaults to False). If True, calculates the sortino ratio in float32 instead of float64, halving the memory used by the new column.\n
     
     <b>Returns:</b>\n
     pd.DataFrame: The original pandas dataframe with an added column for the sortino calculation.
 
    """
-    df2 = df.copy(deep = True)
-    df2['sortino'] = (df2[asset_returns] - df2[riskfree_returns]) / df2[asset_negative_vol]
+    df2 = df if inplace else df.copy(deep = False)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        sortino = np.subtract(df2[asset_returns].to_numpy(), df2[riskfree_returns].to_numpy(), dtype = np.float32 if downcast else np.float64)
+        np.divide(sortino, df2[asset_negative_vol].to_numpy(), out = sortino) #divides on the excess returns buffer
+    df2['sortino'] = sortino
+    return df2
+
+
+def sortino_batch(df: pd.DataFrame, asset_returns: list, riskfree_returns: str, asset_negative_vol: list, inplace: bool = False, downcast: bool = False) -> pd.DataFrame:
+    """Calculates the sortino ratios of several assets at once, when the returns and downside volatilities of each asset are in separate columns of the same dataframe.\n
+
+    <b>Parameters:</b>\n
+    df (pd.DataFrame): Pandas dataframe with the needed data.\n
+    asset_returns (list): names of the columns in the dataframe with the assets returns.\n
+    riskfree_returns (str): name of the column in the dataframe with the risk free rate returns.\n
+    asset_negative_vol (list): names of the columns in the dataframe with the assets downside volatilities, in the same order as asset_returns.\n
+    inplace (bool): Opitional (Defaults to False). If True, adds the new columns to the given dataframe instead of to a shallow copy of it.\n
+    downcast (bool): Opitional (Defaults to False). If True, calculates the sortino ratios in float32 instead of float64.\n
+
+    <b>Returns:</b>\n
+    pd.DataFrame: The original pandas dataframe with an added column '{asset_returns}_sortino' for each asset.
+
+   """
+    if len(asset_returns) != len(asset_negative_vol):
+        raise Exception("Wrong Parameter: asset_returns and asset_negative_vol must have the same length.")
+
+    df2 = df if inplace else df.copy(deep = False)
+    #broadcasts the risk free returns over all the assets, computing every ratio at once in a (rows, assets) buffer
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        sortino = np.subtract(df2[asset_returns].to_numpy(), df2[riskfree_returns].to_numpy()[:, None], dtype = np.float32 if downcast else np.float64)
+        np.divide(sortino, df2[asset_negative_vol].to_numpy(), out = sortino)
+    for i, col in enumerate(asset_returns):
+        df2[col + '_sortino'] = sortino[:, i]
     return df2
 
 
-def capture_ratio(df: pd.DataFrame, asset_returns: str, bench_returns: str, returns_frequency: int, group: str = 'CNPJ_FUNDO') -> pd.DataFrame:
+def capture_ratio(df: pd.DataFrame, asset_returns: str, bench_returns: str, returns_frequency: int, group: str = 'CNPJ_FUNDO', downcast: bool = False, return_only_metrics: bool = False) -> pd.DataFrame:
     """Calculates the capture ratios (measure of assets performance relative to its benchmark in bull and bear markets) of the given assets.\n
 
     <b>Parameters:</b>\n
@@ -621,34 +1124,109 @@ def capture_ratio(df: pd.DataFrame, asset_returns: str, bench_returns: str, retu
     bench_returns (str): name of the column in the dataframe with the benchmark returns.\n
     returns_frequency: (int): Indicates the frequency in days of the given returns. Should be in tradable days (252 days a year, 21 a month, 5 a week for stocks).\n 
     group (str): name of the column in the dataframe used to group values. Example: 'stock_ticker' or 'fund_code'.\n
+    downcast (bool): Opitional (Defaults to False). If True, compounds and annualizes the returns in float32 instead of float64, halving the memory moved by the calculation (with ~7 significant digits of precision).\n
+    return_only_metrics (bool): Opitional (Defaults to False). If True, returns only the capture_bear, capture_bull and capture_ratio columns.\n
     
     <b>Returns:</b>\n
-    pd.DataFrame: The original pandas dataframe with added columns for the capture ratios (bull, bear and ratio bull/bear).\n
+    pd.DataFrame: Pandas dataframe indexed by group, with the annualized returns of the asset and the benchmark, the number of periods and the capture in bear and bull markets, and the capture ratio (bull/bear). Only the assets with bear market periods are returned.\n
 
    """   
 
-    df_bull = df[(df[asset_returns].notnull()) & (df[bench_returns].notnull())].copy(deep = True)
-    df_bear = df[(df[asset_returns].notnull()) & (df[bench_returns].notnull())].copy(deep = True)
+    #only the three used columns are taken from the filtered rows, instead of copying the whole dataframe
+    valid = df[asset_returns].notnull().to_numpy() & df[bench_returns].notnull().to_numpy() #single mask, without index alignment
+    df2 = df.loc[valid, [group, asset_returns, bench_returns]]
+
+    #splits the periods by the sign of the benchmark returns: True (bull) for positive returns and False (bear) for the others.
+    #a boolean key is factorized much faster than a string one
+    market = pd.Series(df2[bench_returns].to_numpy() > 0, index = df2.index)
+
+    #sums the log returns of each asset in bull and bear markets in a single groupby, instead of one product per table
+    dtype = np.float32 if downcast else np.float64
+    log_returns = pd.DataFrame(np.log1p(df2[[asset_returns, bench_returns]].to_numpy(dtype = dtype)),
+                               index = df2.index, columns = [asset_returns, bench_returns])
+    grouped = log_returns.groupby([df2[group], market])
+    log_returns = grouped.sum()
+    nperiods = grouped.size() #the rows with missing returns were already dropped, so no null scan is needed to count them
+
+    #calculates the annualized returns (CAGR) and the capture
+    #the exponent is applied on a single buffer, without intermediate frames
+    cagr = np.multiply(log_returns.to_numpy(), ((252/returns_frequency)/nperiods.to_numpy()).astype(dtype)[:, None])
+    np.expm1(cagr, out = cagr)
+    tables = pd.DataFrame(cagr, index = log_returns.index, columns = log_returns.columns)
+    tables['n_periods'] = nperiods
+    tables['capture'] = tables[asset_returns]/tables[bench_returns]
+
+    #puts the bear and bull markets of each asset side by side, keeping the assets with bear market periods
+    tables = tables.unstack(level = 1)
+    df2 = pd.DataFrame(index = tables.index)
+    for suffix, bull in [('_bear', False), ('_bull', True)]:
+        for col in [asset_returns, bench_returns, 'n_periods', 'capture']:
+            df2[col + suffix] = tables[(col, bull)] if (col, bull) in tables.columns else np.nan
+    df2 = df2[df2['n_periods_bear'].notnull()]
+    df2['n_periods_bear'] = df2['n_periods_bear'].astype('int64')
+    if df2['n_periods_bull'].notnull().all():
+        df2['n_periods_bull'] = df2['n_periods_bull'].astype('int64')
 
-    df_bull = df_bull[df_bull[bench_returns] > 0] #dataframe with only positive returns from the benchmark
-    df_bear = df_bear[df_bear[bench_returns] <= 0] #dataframe with only negative returns from the benchmark
+    df2['capture_ratio'] = df2['capture_bull']/df2['capture_bear']
+    if return_only_metrics:
+        return df2[['capture_bear', 'capture_bull', 'capture_ratio']]
+    return df2
 
-    tables = [df_bull, df_bear]
-    for i, _ in enumerate(tables): #performs set of operations in each table
-        #calculates total returns + 1
-        compound = tables[i].groupby(group)[[asset_returns,bench_returns]].apply(lambda x: np.prod(1+x))
-        
-        #counts number of periods
-        nperiods = tables[i].groupby(group)[[asset_returns]].count().rename(columns = {asset_returns:'n_periods'})
 
-        tables[i] = compound.merge(nperiods, on = group, how  ='left')#joins tables defined above
+def compute_all_metrics(df: pd.DataFrame, asset_returns: str, bench_returns: str, riskfree_returns: str, group: str = 'CNPJ_FUNDO', returns_frequency: int = 1) -> pd.DataFrame:
+    """Calculates the full period performance metrics of the given assets (CAGR, volatility, downside volatility, correlation with the benchmark, beta, alpha, sharpe and sortino) in a single grouped pass over the returns.\n
+    The volatilities, correlation, beta, alpha, sharpe and sortino follow the same definitions of the volatility, corr_benchmark, beta, alpha, sharpe and sortino functions, calculated over the CAGRs.\n
+    The CAGRs are annualized over the number of return periods, as in capture_ratio: (1 + compound return) ** ((252/returns_frequency)/n_periods) - 1.
+    This differs from the CAGR of the returns function, which counts the quotes (n_periods + 1 for the same fund) as days, so the two can give slightly different CAGRs for the same asset.\n
 
-        #calculates the annualized returns (CAGR)
-        tables[i][asset_returns]=(tables[i][asset_returns]**((252/returns_frequency)/tables[i]['n_periods']))-1
-        tables[i][bench_returns]=(tables[i][bench_returns]**((252/returns_frequency)/tables[i]['n_periods']))-1
+    <b>Parameters:</b>\n
+    df (pd.DataFrame): Pandas dataframe with the needed data.\n
+    asset_returns (str): name of the column in the dataframe with the assets returns.\n
+    bench_returns (str): name of the column in the dataframe with the benchmark returns.\n
+    riskfree_returns (str): name of the column in the dataframe with the risk free rate returns.\n
+    group (str): name of the column in the dataframe used to group values. Example: 'stock_ticker' or 'fund_code'.\n
+    returns_frequency: (int): Default = 1. Indicates the frequency in days of the given returns. Should be in tradable days (252 days a year, 21 a month, 5 a week for stocks).\n
 
-        tables[i]['capture'] = tables[i][asset_returns]/tables[i][bench_returns] #calculates the capture
+    <b>Returns:</b>\n
+    pd.DataFrame: Pandas dataframe with the performance metrics of each asset.
 
-    df2 = tables[1].merge(tables[0], on = group, how  ='left',suffixes=('_bear','_bull'))
-    df2['capture_ratio'] = df2['capture_bull']/df2['capture_bear']
-    return df2
\ No newline at end of file
+   """
+    #only periods with the returns of the asset, the benchmark and the risk free rate are considered
+    df2 = df[df[asset_returns].notnull() & df[bench_returns].notnull() & df[riskfree_returns].notnull()]
+    x = df2[asset_returns].to_numpy(dtype = np.float64)
+    y = df2[bench_returns].to_numpy(dtype = np.float64)
+    rf = df2[riskfree_returns].to_numpy(dtype = np.float64)
+    neg = np.where(x < 0, x, 0.0) #negative returns of the asset
+
+    #every sum needed by the metrics is calculated in the same groupby
+    sums = (pd.DataFrame({'n': np.ones(len(x)), 'log_x': np.log1p(x), 'log_y': np.log1p(y), 'log_rf': np.log1p(rf),
+                          'x': x, 'y': y, 'xx': x*x, 'yy': y*y, 'xy': x*y, 'n_neg': (x < 0).astype(np.float64), 'neg': neg, 'neg_neg': neg*neg},
+                         index = df2.index)
+              .groupby(df2[group], sort = False)
+              .sum())
+
+    n = sums['n']
+    periods_year = 252/returns_frequency
+    with np.errstate(invalid = 'ignore', divide = 'ignore'): #assets without variance or negative returns get NaN metrics
+        metrics = pd.DataFrame({asset_returns + '_cagr': np.expm1(sums['log_x'] * periods_year / n),
+                                bench_returns + '_cagr': np.expm1(sums['log_y'] * periods_year / n),
+                                riskfree_returns + '_cagr': np.expm1(sums['log_rf'] * periods_year / n)})
+
+        var_x = np.maximum(sums['xx']/n - (sums['x']/n)**2, 0)
+        var_y = np.maximum(sums['yy']/n - (sums['y']/n)**2, 0)
+        var_neg = np.maximum(sums['neg_neg']/sums['n_neg'] - (sums['neg']/sums['n_neg'])**2, 0)
+        cov = sums['xy']/n - (sums['x']/n)*(sums['y']/n)
+
+        metrics[asset_returns + '_vol'] = np.sqrt(var_x * periods_year)
+        metrics[bench_returns + '_vol'] = np.sqrt(var_y * periods_year)
+        metrics[asset_returns + '_negative_vol'] = np.sqrt(var_neg * periods_year)
+        metrics['correlation_benchmark'] = cov / np.sqrt(var_x * var_y)
+        metrics['beta'] = cov / var_y
+
+        excess = metrics[asset_returns + '_cagr'] - metrics[riskfree_returns + '_cagr']
+        metrics['alpha'] = excess - metrics['beta'] * (metrics[bench_returns + '_cagr'] - metrics[riskfree_returns + '_cagr'])
+        metrics['sharpe'] = excess / metrics[asset_returns + '_vol']
+        metrics['sortino'] = excess / metrics[asset_returns + '_negative_vol']
+
+    metrics['n_periods'] = n.astype(np.int64)
+    return metrics
@@ -1,4 +1,4 @@
-from setuptools import setup, Extension
+from setuptools import setup
 with open('README.md') as f:
   long_description = f.read()
 setup(
@@ -14,14 +14,15 @@ setup(
   url = 'https://github.com/joaopm33/fundspy',   # Provide either the link to your github or to your website
   download_url = 'https://github.com/joaopm33/fundspy/archive/refs/tags/v1.1.tar.gz',    # I explain this later on
   keywords = ['INVESTMENTS', 'FUNDS', 'FINANCE', 'INVESTMENT FUNDS', 'BRAZILIAN ASSETS', 'HEDGE FUNDS', 'MUTUAL FUNDS'],   # Keywords that define your package best
+  python_requires='>=3.9',
   install_requires=[
-                    'requests==2.22.0',
-                    'yahoofinancials==1.6',
-                    'python-dateutil==2.8.1',
-                    'pandas==1.0.5',
-                    'numpy==1.19.3',
-                    'tqdm==4.60.0',
-                    'workalendar==10.3.0'
+                    'requests>=2.22.0',
+                    'yahoofinancials>=1.6',
+                    'python-dateutil>=2.8.1',
+                    'pandas>=2.0',
+                    'numpy>=1.24',
+                    'tqdm>=4.60.0',
+                    'workalendar>=10.3.0'
       ],
   classifiers=[
     'Development Status :: 5 - Production/Stable',      # Chose either "3 - Alpha", "4 - Beta" or "5 - Production/Stable" as the current state of your package
@@ -31,10 +32,9 @@ setup(
     'Topic :: Office/Business :: Financial :: Investment',
     'License :: OSI Approved :: MIT License',   # Again, pick a license
     'Programming Language :: Python :: 3',      #Specify which pyhton versions that you want to support
-    'Programming Language :: Python :: 3.4',
-    'Programming Language :: Python :: 3.5',
-    'Programming Language :: Python :: 3.6',
-    'Programming Language :: Python :: 3.7',
-    'Programming Language :: Python :: 3.8',
+    'Programming Language :: Python :: 3.9',
+    'Programming Language :: Python :: 3.10',
+    'Programming Language :: Python :: 3.11',
+    'Programming Language :: Python :: 3.12',
   ],
 )
\ No newline at end of file